@@ -1,5 +1,10 @@
-from datetime import datetime, timedelta
+import functools
+import hashlib
+import threading
+import time
+from datetime import timedelta
 from typing import Optional
+from cachetools import TLRUCache, TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
@@ -16,12 +21,58 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Tokens expire after 30 minutes
 # ========================================
 # PASSWORD HASHING SETUP
 # ========================================
-# This handles password hashing securely
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# This handles password hashing securely.
+# New hashes use Argon2id (OWASP settings: 46 MiB memory, 1 iteration, 1 lane).
+# Older bcrypt hashes still verify and get upgraded on the next successful login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__memory_cost=46 * 1024,
+    argon2__time_cost=1,
+    argon2__parallelism=1,
+)
+
+# Checked against when the username doesn't exist, so a missing user takes
+# as long to reject as a wrong password (no user enumeration by timing).
+# While legacy bcrypt hashes remain, misses check a bcrypt dummy instead -
+# bcrypt is the slower of the two, so unknown names look like not-yet-upgraded
+# users. Known limitation: users already on Argon2 still answer a wrong
+# password faster than a miss until every bcrypt hash has been upgraded
+_DUMMY_HASH = pwd_context.hash("dummy-password")
+_LEGACY_DUMMY_HASH = pwd_context.handler("bcrypt").hash("dummy-password")
 
 # This tells FastAPI to expect "Bearer token" in Authorization header
 security = HTTPBearer()
 
+# ========================================
+# DECODED TOKEN CACHE
+# ========================================
+# Clients reuse the same token for many requests, so we keep decoded
+# payloads around for a short while instead of re-decoding every time
+JWT_CACHE_TTL_SECONDS = 60
+
+def _token_ttu(token: str, payload: dict, now: float) -> float:
+    """Cache entries expire after the cache TTL or when the token itself expires, whichever is first"""
+    return min(now + JWT_CACHE_TTL_SECONDS, payload["exp"])
+
+_jwt_cache = TLRUCache(maxsize=4096, ttu=_token_ttu, timer=time.time)
+_jwt_cache_lock = threading.Lock()
+
+# ========================================
+# LOGIN CACHE
+# ========================================
+# Successful logins are remembered briefly so repeated identical logins
+# skip the (deliberately slow) password check. Keys are hashed so we
+# never keep plain text passwords in memory
+LOGIN_CACHE_TTL_SECONDS = 30
+
+_login_cache = TTLCache(maxsize=512, ttl=LOGIN_CACHE_TTL_SECONDS)
+_login_cache_lock = threading.Lock()
+
+def _login_cache_key(username: str, password: str) -> bytes:
+    """Build the login cache key without storing the password itself"""
+    return hashlib.sha256((username + "\x00" + password).encode()).digest()
+
 # ========================================
 # PYDANTIC MODELS FOR AUTH
 # ========================================
@@ -57,6 +108,10 @@ fake_users_db = {
     }
 }
 
+# Guards the "is this username free?" check + insert in create_user. Hashing
+# happens outside it (it's slow), so two registrations can overlap
+_users_lock = threading.Lock()
+
 # ========================================
 # PASSWORD FUNCTIONS
 # ========================================
@@ -88,10 +143,13 @@ def get_password_hash(password: str) -> str:
 # ========================================
 # USER MANAGEMENT FUNCTIONS
 # ========================================
+@functools.lru_cache(maxsize=1024)
 def get_user(username: str):
     """
     Get user from our 'database'
     
+    Results are cached - call clear_user_caches() after changing fake_users_db
+    
     Args:
         username: Username to look for
     
@@ -102,6 +160,18 @@ def get_user(username: str):
         return fake_users_db[username]
     return None
 
+def _dummy_hash() -> str:
+    """
+    Pick the dummy hash a missing user is checked against
+    
+    Returns:
+        The bcrypt dummy while any stored hash is still bcrypt, else the Argon2 one
+    """
+    users = list(fake_users_db.values())
+    if any(pwd_context.identify(user["hashed_password"]) == "bcrypt" for user in users):
+        return _LEGACY_DUMMY_HASH
+    return _DUMMY_HASH
+
 def authenticate_user(username: str, password: str):
     """
     Verify user credentials
@@ -113,13 +183,28 @@ def authenticate_user(username: str, password: str):
     Returns:
         User dict if credentials are valid, False otherwise
     """
+    cache_key = _login_cache_key(username, password)
+    with _login_cache_lock:
+        cached_user = _login_cache.get(cache_key)
+    if cached_user is not None:
+        return cached_user  # Same credentials verified moments ago
+    
     user = get_user(username)
     if not user:
+        pwd_context.verify(password, _dummy_hash())  # Same cost as a real check
         return False  # User doesn't exist
     
-    if not verify_password(password, user["hashed_password"]):
+    verified, new_hash = pwd_context.verify_and_update(password, user["hashed_password"])
+    if not verified:
         return False  # Wrong password
     
+    # Upgrade hashes made with an older scheme/settings (e.g. bcrypt -> argon2)
+    if new_hash:
+        user["hashed_password"] = new_hash
+    
+    with _login_cache_lock:
+        _login_cache[cache_key] = user
+    
     return user  # Success!
 
 def create_user(username: str, password: str) -> dict:
@@ -136,21 +221,37 @@ def create_user(username: str, password: str) -> dict:
     Raises:
         HTTPException if username already exists
     """
+    username_taken = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Username already registered"
+    )
     if username in fake_users_db:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
+        raise username_taken
     
-    # Hash the password before storing
+    # Hash the password before storing (slow - done outside the lock)
     hashed_password = get_password_hash(password)
-    fake_users_db[username] = {
-        "username": username,
-        "hashed_password": hashed_password
-    }
+    
+    # Check again: another registration for the same name may have won
+    # while we were hashing
+    with _users_lock:
+        if username in fake_users_db:
+            raise username_taken
+        fake_users_db[username] = {
+            "username": username,
+            "hashed_password": hashed_password
+        }
+    
+    # Make sure cached lookups see the new user
+    clear_user_caches()
     
     return {"username": username, "message": "User created successfully"}
 
+def clear_user_caches():
+    """Forget cached user lookups and logins (call after changing fake_users_db)"""
+    get_user.cache_clear()
+    with _login_cache_lock:
+        _login_cache.clear()
+
 # ========================================
 # JWT TOKEN FUNCTIONS
 # ========================================
@@ -167,11 +268,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """
     to_encode = data.copy()
     
-    # Set expiration time
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+    # Set expiration time as a POSIX timestamp (what the "exp" claim holds anyway)
+    lifetime = expires_delta or timedelta(minutes=15)
+    expire = int(time.time()) + int(lifetime.total_seconds())
     
     # Add expiration to token data
     to_encode.update({"exp": expire})
@@ -180,6 +279,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _decode_token(token: str) -> dict:
+    """
+    Decode a JWT token, reusing the cached payload if we've seen it recently
+    
+    Args:
+        token: Raw JWT token string
+    
+    Returns:
+        Decoded token payload
+    
+    Raises:
+        JWTError if the token is invalid or expired
+    """
+    with _jwt_cache_lock:
+        payload = _jwt_cache.get(token)
+    if payload is not None:
+        return payload
+    
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    # Only tokens with an expiry can be cached safely
+    if isinstance(payload.get("exp"), (int, float)):
+        with _jwt_cache_lock:
+            _jwt_cache[token] = payload
+    return payload
+
 # ========================================
 # DEPENDENCY FOR PROTECTED ROUTES
 # ========================================
@@ -212,8 +337,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         # Extract the actual token from credentials
         token = credentials.credentials
         
-        # Decode and verify the JWT token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Decode and verify the JWT token (cached for repeat requests)
+        payload = _decode_token(token)
         
         # Extract username from token
         username: str = payload.get("sub")
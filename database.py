@@ -1,168 +1,418 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Optional
-from models import Task, TaskCreate, TaskUpdate, TaskStatus
+from typing import Iterator, List, Optional
+from models import Task, TaskCreate, TaskUpdate, TaskStatus, TaskOut
 import json
 
+# Applied once to every new connection
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-64000;
+"""
+
+# Tables and indexes, one statement each. Shared with the test suite so the
+# test database always matches the real schema
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+    # Indexes for status filtering and the weekly stats (by created_at).
+    # The composite index also serves plain "WHERE status = ?" lookups
+    "CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks(status, created_at)",
+    # Change counter for get_version(). The triggers bump it inside the same
+    # transaction as every insert/update/delete - including writes that don't
+    # go through TaskDatabase - so it only ever goes up, whatever the clock does
+    """
+    CREATE TABLE IF NOT EXISTS tasks_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO tasks_version (id, version) VALUES (1, 0)",
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_version_insert AFTER INSERT ON tasks
+    BEGIN UPDATE tasks_version SET version = version + 1 WHERE id = 1; END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_version_update AFTER UPDATE ON tasks
+    BEGIN UPDATE tasks_version SET version = version + 1 WHERE id = 1; END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_version_delete AFTER DELETE ON tasks
+    BEGIN UPDATE tasks_version SET version = version + 1 WHERE id = 1; END
+    """,
+)
+
+# Number of read-only connections GET requests can use in parallel
+READER_POOL_SIZE = 4
+
+# How long a read waits for a free reader connection before giving up
+READER_TIMEOUT_SECONDS = 5.0
+
+class DatabaseBusyError(Exception):
+    """Raised when no reader connection frees up within the read timeout"""
+
+# Columns every task query reads - listed explicitly so adding a column to the
+# table doesn't change what (or how much) the reads return
+TASK_COLUMNS = "id, title, description, status, created_at, updated_at"
+
+# Hot-path SQL, kept as constants so every call passes the exact same string
+# and hits the connection's prepared statement cache instead of re-parsing
+STATEMENTS = {
+    "insert": """
+        INSERT INTO tasks (title, description, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "select_all": f"SELECT {TASK_COLUMNS} FROM tasks",
+    # Served in order straight from idx_tasks_status_created (id is its last key)
+    "select_by_status": f"SELECT {TASK_COLUMNS} FROM tasks WHERE status = ? ORDER BY created_at, id",
+    # Keyset pages for streaming: the next rows after the last one sent
+    "page_all": f"SELECT {TASK_COLUMNS} FROM tasks WHERE id > ? ORDER BY id LIMIT ?",
+    "page_by_status": f"""
+        SELECT {TASK_COLUMNS} FROM tasks
+        WHERE status = ? AND (created_at, id) > (?, ?)
+        ORDER BY created_at, id
+        LIMIT ?
+    """,
+    "select_by_id": f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?",
+    "update": f"""
+        UPDATE tasks 
+        SET title = COALESCE(?, title),
+            description = COALESCE(?, description),
+            status = COALESCE(?, status),
+            updated_at = ?
+        WHERE id = ?
+        RETURNING {TASK_COLUMNS}
+    """,
+    "delete": "DELETE FROM tasks WHERE id = ?",
+    "count": "SELECT COUNT(*) FROM tasks",
+    "count_by_status": "SELECT COUNT(*) FROM tasks WHERE status = ?",
+    "version": "SELECT version FROM tasks_version WHERE id = 1",
+    "weekly_stats": """
+        SELECT date(substr(created_at, 1, 10), '-3 days', 'weekday 4') AS week_thursday,
+               COUNT(*) AS total,
+               SUM(CASE WHEN status = ?1 THEN 1 ELSE 0 END) AS completed,
+               ROUND(100.0 * SUM(CASE WHEN status = ?1 THEN 1 ELSE 0 END) / COUNT(*), 2) AS completion_percentage
+        FROM tasks
+        GROUP BY week_thursday
+        ORDER BY week_thursday
+    """,
+}
+
+def _row_to_task(row: sqlite3.Row) -> Task:
+    """
+    Build a Task from a tasks row without re-validating it.
+    
+    Rows only ever come from our own validated inserts/updates, so
+    model_construct is safe here and much cheaper than Task(...)
+    """
+    return Task.model_construct(
+        id=row["id"],
+        title=row["title"],
+        description=row["description"],
+        status=row["status"],  # Task stores the plain value (use_enum_values)
+        created_at=row["created_at"],
+        updated_at=row["updated_at"]
+    )
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Set up a connection the way TaskDatabase expects (row access by name + pragmas)"""
+    conn.row_factory = sqlite3.Row
+    conn.executescript(CONNECTION_PRAGMAS)
+    return conn
+
 class TaskDatabase:
-    def __init__(self, db_path: str = "tasks.db"):
+    def __init__(self, db_path: str = "tasks.db", readers: int = READER_POOL_SIZE):
         self.db_path = db_path
-        self.init_database()
+        # Single writer connection, opened (and the schema created) by open()
+        # or by the first read/write. It's shared between threads, so every
+        # write goes through self._lock
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # Pool of (db_path, connection) reader slots. With WAL, readers don't
+        # block each other or the writer, so reads can run in parallel.
+        # Connections are opened lazily and reopened if db_path changes
+        self._readers: queue.Queue = queue.Queue()
+        for _ in range(readers):
+            self._readers.put((None, None))
+        self.read_timeout = READER_TIMEOUT_SECONDS
+
+    def open(self):
+        """
+        Open the writer connection and make sure the schema exists.
+        
+        Called once at app startup, so the work isn't left to the first
+        request. Nothing touches the database file before this (or before
+        the first read/write, for scripts that don't call open()).
+        """
+        self._conn()
+
+    def close(self):
+        """Close the writer and any idle reader connections"""
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        
+        slots = []
+        while True:
+            try:
+                slots.append(self._readers.get_nowait())
+            except queue.Empty:
+                break
+        for _, conn in slots:
+            if conn is not None:
+                conn.close()
+            self._readers.put((None, None))
+
+    def _connect(self) -> sqlite3.Connection:
+        # uri=True also accepts "file:...?mode=memory&cache=shared" style paths
+        return configure_connection(sqlite3.connect(
+            self.db_path, uri=True, check_same_thread=False, isolation_level=None
+        ))
+
+    def _conn(self) -> sqlite3.Connection:
+        """Get the writer connection, opening it and creating the schema on first use"""
+        if self.conn is None:
+            with self._lock:
+                if self.conn is None:
+                    conn = self._connect()
+                    self.conn = conn
+                    try:
+                        self.init_database()
+                    except BaseException:
+                        self.conn = None
+                        conn.close()
+                        raise
+        return self.conn
+
+    @contextmanager
+    def _read(self):
+        """
+        Borrow a reader connection from the pool.
+        
+        Waits up to read_timeout seconds if every reader is in use, then
+        raises DatabaseBusyError instead of queueing forever.
+        """
+        try:
+            path, conn = self._readers.get(timeout=self.read_timeout)
+        except queue.Empty:
+            raise DatabaseBusyError("All database reader connections are busy") from None
+        try:
+            if conn is None or path != self.db_path:
+                if conn is not None:
+                    conn.close()
+                self._conn()  # Make sure the schema exists before reading
+                path, conn = self.db_path, self._connect()
+                conn.execute("PRAGMA query_only=ON")
+            yield conn
+        finally:
+            self._readers.put((path, conn))
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed writes in one transaction"""
+        with self._lock:
+            conn = self._conn()
+            conn.execute("BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # A failed COMMIT must not leave the shared writer inside a
+                # transaction; SQLite may also have rolled back already
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
 
     def init_database(self):
         """Initialize the SQLite database and create tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    status TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-            """)
-            conn.commit()
+            for statement in SCHEMA:
+                cursor.execute(statement)
+            # Refresh planner statistics so SQLite actually picks the indexes
+            cursor.execute("ANALYZE")
             print(f"✅ Database initialized: {self.db_path}")
 
     def create_task(self, task_data: TaskCreate) -> Task:
         """Create a new task and return it"""
         now = datetime.now().isoformat()
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO tasks (title, description, status, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (task_data.title, task_data.description, task_data.status.value, now, now))
+            cursor.execute(STATEMENTS["insert"], (task_data.title, task_data.description, task_data.status, now, now))
             
             task_id = cursor.lastrowid
-            conn.commit()
         
-        # Return the created task
-        return Task(
+        # Return the created task - task_data is already validated, so skip
+        # running the Task validators again
+        return Task.model_construct(
             id=task_id,
             title=task_data.title,
             description=task_data.description,
             status=task_data.status,
-            created_at=datetime.fromisoformat(now),
-            updated_at=datetime.fromisoformat(now)
+            created_at=now,
+            updated_at=now
         )
 
     def get_all_tasks(self, status_filter: Optional[TaskStatus] = None) -> List[Task]:
         """Get all tasks, optionally filtered by status"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             cursor = conn.cursor()
             
             if status_filter:
-                cursor.execute("SELECT * FROM tasks WHERE status = ?", (status_filter.value,))
+                cursor.execute(STATEMENTS["select_by_status"], (status_filter.value,))
             else:
-                cursor.execute("SELECT * FROM tasks")
+                cursor.execute(STATEMENTS["select_all"])
             
             rows = cursor.fetchall()
+        
+        return [_row_to_task(row) for row in rows]
+
+    def iter_task_batches(self, status_filter: Optional[TaskStatus] = None, batch_size: int = 500) -> Iterator[List[TaskOut]]:
+        """
+        Stream all tasks as batches of TaskOut structs, optionally filtered by status.
+        
+        Same rows (in the same order) as get_all_tasks, but without building
+        (or validating) Task models - timestamps stay as the ISO strings stored
+        in the database. Each batch is its own short keyset query for the rows
+        after the last one sent, so a slow consumer never holds a reader
+        connection or an open read snapshot between batches, and the full
+        table is never held in memory.
+        """
+        last_id, last_created_at = 0, ""
+        while True:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                
+                if status_filter:
+                    cursor.execute(STATEMENTS["page_by_status"], (status_filter.value, last_created_at, last_id, batch_size))
+                else:
+                    cursor.execute(STATEMENTS["page_all"], (last_id, batch_size))
+                
+                rows = cursor.fetchall()
             
-            tasks = []
-            for row in rows:
-                tasks.append(Task(
-                    id=row[0],
-                    title=row[1],
-                    description=row[2],
-                    status=TaskStatus(row[3]),
-                    created_at=datetime.fromisoformat(row[4]),
-                    updated_at=datetime.fromisoformat(row[5])
-                ))
-            
-            return tasks
+            if rows:
+                yield [TaskOut(**row) for row in rows]
+            if len(rows) < batch_size:
+                break
+            last_id, last_created_at = rows[-1]["id"], rows[-1]["created_at"]
 
     def get_task_by_id(self, task_id: int) -> Optional[Task]:
         """Get a specific task by its ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
+            cursor.execute(STATEMENTS["select_by_id"], (task_id,))
             row = cursor.fetchone()
-            
-            if row:
-                return Task(
-                    id=row[0],
-                    title=row[1],
-                    description=row[2],
-                    status=TaskStatus(row[3]),
-                    created_at=datetime.fromisoformat(row[4]),
-                    updated_at=datetime.fromisoformat(row[5])
-                )
-            return None
+        
+        if row:
+            return _row_to_task(row)
+        return None
+
+    def get_task_out(self, task_id: int) -> Optional[TaskOut]:
+        """Get a specific task by its ID, ready for encoding as a response"""
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS["select_by_id"], (task_id,))
+            row = cursor.fetchone()
+        
+        if row:
+            return TaskOut(**row)
+        return None
 
     def update_task(self, task_id: int, task_update: TaskUpdate) -> Optional[Task]:
         """Update an existing task"""
-        # First check if task exists
-        existing_task = self.get_task_by_id(task_id)
-        if not existing_task:
-            return None
-        
-        # Prepare update data
         now = datetime.now().isoformat()
         
-        # Use existing values if update fields are None
-        new_title = task_update.title if task_update.title is not None else existing_task.title
-        new_description = task_update.description if task_update.description is not None else existing_task.description
-        new_status = task_update.status if task_update.status is not None else existing_task.status
-        
-        with sqlite3.connect(self.db_path) as conn:
+        # Fields left as None keep their current value (COALESCE); RETURNING
+        # gives us the updated row without a separate SELECT
+        with self._transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE tasks 
-                SET title = ?, description = ?, status = ?, updated_at = ?
-                WHERE id = ?
-            """, (new_title, new_description, new_status.value, now, task_id))
-            conn.commit()
+            cursor.execute(STATEMENTS["update"], (task_update.title, task_update.description, task_update.status, now, task_id))
+            row = cursor.fetchone()
+        
+        # Task doesn't exist
+        if row is None:
+            return None
         
         # Return the updated task
-        return Task(
-            id=task_id,
-            title=new_title,
-            description=new_description,
-            status=new_status,
-            created_at=existing_task.created_at,
-            updated_at=datetime.fromisoformat(now)
-        )
+        return _row_to_task(row)
 
     def delete_task(self, task_id: int) -> bool:
         """Delete a task by ID. Returns True if deleted, False if not found"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            cursor.execute(STATEMENTS["delete"], (task_id,))
             deleted_rows = cursor.rowcount
-            conn.commit()
-            
-            return deleted_rows > 0
+        
+        return deleted_rows > 0
 
     def get_task_count(self) -> int:
         """Get total number of tasks"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM tasks")
+            cursor.execute(STATEMENTS["count"])
             return cursor.fetchone()[0]
 
     def get_completed_tasks_count(self) -> int:
         """Get number of completed tasks"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (TaskStatus.COMPLETED.value,))
+            cursor.execute(STATEMENTS["count_by_status"], (TaskStatus.COMPLETED.value,))
             return cursor.fetchone()[0]
 
+    def get_version(self) -> str:
+        """
+        Get a cheap fingerprint of the tasks table.
+        
+        Changes whenever a task is created, updated or deleted, so it can be
+        used to tell clients their cached task list is still current.
+        """
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS["version"])
+            return str(cursor.fetchone()[0])
+
+    def get_weekly_stats(self) -> List[tuple]:
+        """
+        Count total and completed tasks per ISO week of created_at.
+        
+        Each week is identified by its Thursday (ISO weeks belong to the year
+        their Thursday falls in). Returns (week_thursday, total, completed,
+        completion_percentage) tuples ordered by week.
+        """
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATEMENTS["weekly_stats"], (TaskStatus.COMPLETED.value,))
+            return cursor.fetchall()
+
     def get_database_info(self) -> dict:
         """Get info about the database - useful for testing"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
             tables = cursor.fetchall()
-            
-            return {
-                "database_path": self.db_path,
-                "tables": [table[0] for table in tables],
-                "total_tasks": self.get_task_count()
-            }
+        
+        return {
+            "database_path": self.db_path,
+            "tables": [table[0] for table in tables],
+            "total_tasks": self.get_task_count()
+        }
 
 # Create a global instance that will be used by our API
 task_db = TaskDatabase()
\ No newline at end of file
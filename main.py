@@ -1,19 +1,52 @@
-from fastapi import FastAPI, HTTPException, status, Depends
-from models import TaskCreate, TaskStatus, Task, TaskUpdate
-from database import task_db
+import hashlib
+import itertools
+import msgspec
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, status, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from models import TaskCreate, TaskStatus, Task, TaskUpdate, TaskOut
+from database import task_db, DatabaseBusyError
 from auth import (
     authenticate_user, create_access_token, get_current_user, 
     UserLogin, UserCreate, Token, create_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from typing import List, Dict
-from datetime import datetime, timedelta
-from collections import defaultdict
+from typing import Iterable, Iterator, List, Dict, Optional
+from datetime import date, datetime, timedelta
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database (connection, pragmas and schema) once at startup"""
+    task_db.open()
+    yield
+    task_db.close()
+
 app = FastAPI(
     title="Task Management API with Authentication->Technical Assessment [:)]",
     description="A RESTful API for managing tasks with JWT authentication(bonus yami) ",
-    version="1.1.0"
+    version="1.1.0",
+    default_response_class=ORJSONResponse,  # orjson is much faster than the stdlib json encoder
+    lifespan=lifespan
 )
+
+# msgspec encodes TaskOut structs faster than either json or orjson handle dicts
+_json_encoder = msgspec.json.Encoder()
+
+class MsgspecJSONResponse(JSONResponse):
+    """JSON response encoded by msgspec - used for TaskOut responses"""
+    def render(self, content) -> bytes:
+        return _json_encoder.encode(content)
+
+@app.exception_handler(DatabaseBusyError)
+async def database_busy_handler(request: Request, exc: DatabaseBusyError):
+    """Every reader connection stayed busy for the whole read timeout - ask the client to retry"""
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy, please retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
 @app.get("/")
 async def read_root():
     """
@@ -55,7 +88,8 @@ async def register_user(user_data: UserCreate):
     - Success message with username
     """
     try:
-        result = create_user(user_data.username, user_data.password)
+        # Password hashing is slow on purpose - keep it off the event loop
+        result = await run_in_threadpool(create_user, user_data.username, user_data.password)
         return result
     except HTTPException:
         # Re-raise HTTP exceptions from create_user function
@@ -87,7 +121,10 @@ async def login_user(user_credentials: UserLogin):
     
     """
     # Try to authenticate the user(Just  a demo)
-    user = authenticate_user(user_credentials.username, user_credentials.password)
+    # Password checking is slow on purpose - keep it off the event loop
+    user = await run_in_threadpool(
+        authenticate_user, user_credentials.username, user_credentials.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -130,10 +167,12 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
     }
 
 
-# All endpoints below require authentication via Bearer token
+# All endpoints below require authentication via Bearer token.
+# The ones that touch the database are plain `def` - FastAPI runs them in its
+# threadpool, so waiting on SQLite (or on a free reader) never blocks the event loop
 
-@app.post("/tasks", response_model=Task, status_code=status.HTTP_201_CREATED)
-async def create_task(
+@app.post("/tasks", response_model=None, status_code=status.HTTP_201_CREATED, responses={201: {"model": Task}})
+def create_task(
     task_data: TaskCreate, 
     current_user: dict = Depends(get_current_user)
 ):
@@ -170,15 +209,46 @@ async def create_task(
     try:
         # The current_user parameter ensures user is authenticated
         created_task = task_db.create_task(task_data)
-        return created_task
+        # Built from already validated input - serialize it as is instead of
+        # having FastAPI validate it against Task again
+        return ORJSONResponse(created_task.model_dump(), status_code=status.HTTP_201_CREATED)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create task: {str(e)}"
         )
 
-@app.get("/tasks", response_model=List[Task])
-async def get_all_tasks(
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header (a list of ETags, or "*") against our ETag, ignoring W/ prefixes"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def _stream_json_array(batches: Iterable[List[TaskOut]]) -> Iterator[bytes]:
+    """
+    Encode batches of tasks as the chunks of a single JSON array
+    
+    If a batch fails after the response has started, the error propagates and
+    the server drops the connection, so clients see a broken transfer rather
+    than a complete-looking (but cut off) array.
+    """
+    yield b"["
+    separator = b""
+    for batch in batches:
+        if not batch:
+            continue
+        # Encode the whole batch in one msgspec call and drop its [ ]
+        yield separator + _json_encoder.encode(batch)[1:-1]
+        separator = b","
+    yield b"]"
+
+@app.get("/tasks", response_model=None, responses={200: {"model": List[Task]}})
+def get_all_tasks(
+    request: Request,
     status_filter: TaskStatus = None,
     current_user: dict = Depends(get_current_user)
 ):
@@ -193,20 +263,119 @@ async def get_all_tasks(
     **Returns:**
     - List of all tasks if no filter is provided
     - List of filtered tasks if status is specified
+    - 304 Not Modified if the `If-None-Match` header matches the current `ETag`
+    
+    The list is streamed as it's read from the database, so large task lists
+    start arriving right away and are never fully held in memory.
     
     """
     try:
-        # Get tasks with optional status filter
-        tasks = task_db.get_all_tasks(status_filter=status_filter)
-        return tasks
+        # Cheap ETag from the table's change counter - if the client already
+        # has this version, skip reading and serializing the tasks
+        version = f"{task_db.get_version()}:{status_filter.value if status_filter else ''}"
+        etag = '"' + hashlib.blake2b(version.encode(), digest_size=8).hexdigest() + '"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        
+        # Get tasks with optional status filter and stream them out batch by batch.
+        # The first batch is read up front, so a database error is still a
+        # clean 500 here instead of a 200 whose body stops part way
+        batches = task_db.iter_task_batches(status_filter=status_filter)
+        first_batch = next(batches, [])
+        return StreamingResponse(
+            _stream_json_array(itertools.chain([first_batch], batches)),
+            media_type="application/json",
+            headers={"ETag": etag}
+        )
+    except DatabaseBusyError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve tasks: {str(e)}"
         )
 
-@app.get("/tasks/{task_id}", response_model=Task)
-async def get_task_by_id(
+@app.get("/tasks/weekly-stats", response_model=dict)
+def get_weekly_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Get the percentage of completed tasks per week.
+    
+    **Authentication required**: Include Bearer token in Authorization header.
+    
+    **Response:**
+    Statistics showing:
+    - Week identifier (YYYY-W##)
+    - Week date range (start and end dates)
+    - Total tasks created that week
+    - Completed tasks that week  
+    - Completion percentage
+    
+    **Note:** Weeks are based on when tasks were created (created_at field).
+    
+    **Example Response:**
+    ```json
+    {
+        "message": "Weekly statistics for 2 weeks",
+        "total_weeks": 2,
+        "weekly_stats": [
+            {
+                "week": "2025-W22",
+                "week_start": "2025-05-26",
+                "week_end": "2025-06-01",
+                "total_tasks": 5,
+                "completed_tasks": 3,
+                "completion_percentage": 60.0
+            }
+        ]
+    }
+    ```
+    """
+    try:
+        # Let SQLite group the tasks by week - we only loop over the weeks
+        weekly_rows = task_db.get_weekly_stats()
+        
+        if not weekly_rows:
+            return {
+                "message": "No tasks found",
+                "total_weeks": 0,
+                "weekly_stats": []
+            }
+        
+        # Build the response - SQLite already did the counting and percentages
+        weekly_stats = []
+        for week_thursday, total, completed, percentage in weekly_rows:
+            # ISO week string (e.g., "2025-W22") and its Monday-Sunday range
+            thursday = date.fromisoformat(week_thursday)
+            year, week_num, _ = thursday.isocalendar()
+            week_start = thursday - timedelta(days=3)
+            week_end = thursday + timedelta(days=3)
+            
+            weekly_stats.append({
+                "week": f"{year}-W{week_num:02d}",
+                "week_start": week_start.strftime("%Y-%m-%d"),
+                "week_end": week_end.strftime("%Y-%m-%d"),
+                "total_tasks": total,
+                "completed_tasks": completed,
+                "completion_percentage": percentage
+            })
+        
+        return {
+            "message": f"Weekly statistics for {len(weekly_stats)} weeks",
+            "total_weeks": len(weekly_stats),
+            "weekly_stats": weekly_stats,
+            "user": current_user["username"]  # Show which user requested this
+        }
+        
+    except DatabaseBusyError:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to calculate weekly stats: {str(e)}"
+        )
+
+@app.get("/tasks/{task_id}", response_model=None, responses={200: {"model": Task}})
+def get_task_by_id(
     task_id: int,
     current_user: dict = Depends(get_current_user)
 ):
@@ -223,14 +392,16 @@ async def get_task_by_id(
     - 404 error if task doesn't exist
     """
     try:
-        task = task_db.get_task_by_id(task_id)
+        task = task_db.get_task_out(task_id)
         if task is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Task with ID {task_id} not found"
             )
-        return task
-    except HTTPException:
+        # The task came straight from our database - encode it directly
+        # instead of having FastAPI validate it against Task again
+        return MsgspecJSONResponse(task)
+    except (HTTPException, DatabaseBusyError):
         raise
     except Exception as e:
         raise HTTPException(
@@ -238,8 +409,8 @@ async def get_task_by_id(
             detail=f"Failed to retrieve task: {str(e)}"
         )
 
-@app.put("/tasks/{task_id}", response_model=Task)
-async def update_task(
+@app.put("/tasks/{task_id}", response_model=None, responses={200: {"model": Task}})
+def update_task(
     task_id: int, 
     task_update: TaskUpdate,
     current_user: dict = Depends(get_current_user)
@@ -270,8 +441,9 @@ async def update_task(
                 detail=f"Task with ID {task_id} not found"
             )
         
-        return updated_task
-    except HTTPException:
+        # Row straight from our database - skip response validation here too
+        return ORJSONResponse(updated_task.model_dump())
+    except (HTTPException, DatabaseBusyError):
         raise
     except Exception as e:
         raise HTTPException(
@@ -280,7 +452,7 @@ async def update_task(
         )
 
 @app.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_task(
+def delete_task(
     task_id: int,
     current_user: dict = Depends(get_current_user)
 ):
@@ -308,7 +480,7 @@ async def delete_task(
         
         # Success! FastAPI automatically returns 204 No Content
         
-    except HTTPException:
+    except (HTTPException, DatabaseBusyError):
         raise
     except Exception as e:
         raise HTTPException(
@@ -316,107 +488,10 @@ async def delete_task(
             detail=f"Failed to delete task: {str(e)}"
         )
 
-@app.get("/tasks/weekly-stats", response_model=dict)
-async def get_weekly_stats(current_user: dict = Depends(get_current_user)):
-    """
-    Get the percentage of completed tasks per week.
-    
-    **Authentication required**: Include Bearer token in Authorization header.
-    
-    **Response:**
-    Statistics showing:
-    - Week identifier (YYYY-W##)
-    - Week date range (start and end dates)
-    - Total tasks created that week
-    - Completed tasks that week  
-    - Completion percentage
-    
-    **Note:** Weeks are based on when tasks were created (created_at field).
-    
-    **Example Response:**
-    ```json
-    {
-        "message": "Weekly statistics for 2 weeks",
-        "total_weeks": 2,
-        "weekly_stats": [
-            {
-                "week": "2025-W22",
-                "week_start": "2025-05-26",
-                "week_end": "2025-06-01",
-                "total_tasks": 5,
-                "completed_tasks": 3,
-                "completion_percentage": 60.0
-            }
-        ]
-    }
-    ```
-    """
-    try:
-        # Get all tasks from database
-        all_tasks = task_db.get_all_tasks()
-        
-        if not all_tasks:
-            return {
-                "message": "No tasks found",
-                "total_weeks": 0,
-                "weekly_stats": []
-            }
-        
-        # Group tasks by week using defaultdict
-        weekly_data = defaultdict(lambda: {"total": 0, "completed": 0})
-        
-        for task in all_tasks:
-            # Get the ISO week string (e.g., "2025-W22")
-            year, week_num, _ = task.created_at.isocalendar()
-            week_key = f"{year}-W{week_num:02d}"
-            
-            # Count total tasks for this week
-            weekly_data[week_key]["total"] += 1
-            
-            # Count completed tasks for this week
-            if task.status == TaskStatus.COMPLETED:
-                weekly_data[week_key]["completed"] += 1
-        
-        # Calculate percentages and build response
-        weekly_stats = []
-        for week, data in sorted(weekly_data.items()):
-            total = data["total"]
-            completed = data["completed"]
-            
-            # Calculate completion percentage
-            percentage = round((completed / total) * 100, 2) if total > 0 else 0
-            
-            # Get week date range for better readability
-            year, week_num = week.split("-W")
-            week_start = datetime.strptime(f"{year}-W{week_num}-1", "%Y-W%W-%w")
-            week_end = week_start + timedelta(days=6)
-            
-            weekly_stats.append({
-                "week": week,
-                "week_start": week_start.strftime("%Y-%m-%d"),
-                "week_end": week_end.strftime("%Y-%m-%d"),
-                "total_tasks": total,
-                "completed_tasks": completed,
-                "completion_percentage": percentage
-            })
-        
-        return {
-            "message": f"Weekly statistics for {len(weekly_stats)} weeks",
-            "total_weeks": len(weekly_stats),
-            "weekly_stats": weekly_stats,
-            "user": current_user["username"]  # Show which user requested this
-        }
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to calculate weekly stats: {str(e)}"
-        )
-
 # These are for testing and don't require authentication
 
 @app.get("/test/database")
-async def test_database():
+def test_database():
     """
     Test database functionality - publicly accessible for testing.
     
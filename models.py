@@ -1,36 +1,69 @@
-from pydantic import BaseModel, Field
+import msgspec
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, WrapValidator
 from enum import Enum
-from datetime import datetime
-from typing import Optional
+from typing import Annotated
 
 # Define the possible task statuses
 class TaskStatus(str, Enum):
     PENDING = "Pending"
     COMPLETED = "Completed"
 
+# Value -> member lookup table. Calling TaskStatus("Pending") goes through the
+# Enum metaclass every time; a dict lookup doesn't
+_STATUS_MEMBERS = {member.value: member for member in TaskStatus}
+
+def _status_value(value, handler):
+    """Validate a status with a dict lookup, leaving bad input to the normal enum validator"""
+    if isinstance(value, str):
+        member = _STATUS_MEMBERS.get(value)
+        if member is not None:
+            return member.value
+    return handler(value)
+
+# Shared string types so the length rules live in one place
+TitleStr = Annotated[str, StringConstraints(min_length=1, max_length=200)]
+DescStr = Annotated[str, StringConstraints(max_length=1000)]
+# A TaskStatus (same schema and errors) validated to its plain value - only
+# for models with use_enum_values=True
+StatusStr = Annotated[TaskStatus, WrapValidator(_status_value)]
+
 # This is what we receive when someone creates a task
 class TaskCreate(BaseModel):
-    title: str = Field(..., min_length=1, max_length=200, description="Task title")
-    description: Optional[str] = Field(None, max_length=1000, description="Task description")
-    status: TaskStatus = Field(default=TaskStatus.PENDING, description="Task status")
+    # Keep status as its plain string value - ready for SQLite without .value
+    model_config = ConfigDict(use_enum_values=True, validate_default=True)
+
+    title: TitleStr = Field(..., description="Task title")
+    description: DescStr | None = Field(None, description="Task description")
+    status: StatusStr = Field(default=TaskStatus.PENDING, description="Task status")
 
 # This is what we receive when someone updates a task
 class TaskUpdate(BaseModel):
-    title: Optional[str] = Field(None, min_length=1, max_length=200)
-    description: Optional[str] = Field(None, max_length=1000)
-    status: Optional[TaskStatus] = None
+    model_config = ConfigDict(use_enum_values=True)
+
+    title: TitleStr | None = None
+    description: DescStr | None = None
+    status: StatusStr | None = None
 
 # Complete task object with all fields
 class Task(BaseModel):
+    # Store status as its plain string value; serialization is left to pydantic-core
+    model_config = ConfigDict(use_enum_values=True)
+
     id: int = Field(..., description="Unique task ID")
     title: str = Field(..., description="Task title")
-    description: Optional[str] = Field(None, description="Task description")
-    status: TaskStatus = Field(..., description="Task status")
-    created_at: datetime = Field(..., description="When task was created")
-    updated_at: datetime = Field(..., description="When task was last updated")
-
-    class Config:
-        # The model can  work with datetime objects
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
\ No newline at end of file
+    description: str | None = Field(None, description="Task description")
+    status: StatusStr = Field(..., description="Task status")
+    # Timestamps are kept as the ISO 8601 strings stored in the database -
+    # they go straight into the JSON response without a parse/format round-trip
+    created_at: str = Field(..., description="When task was created", json_schema_extra={"format": "date-time"})
+    updated_at: str = Field(..., description="When task was last updated", json_schema_extra={"format": "date-time"})
+
+# Lightweight copy of Task used only for encoding read responses with msgspec.
+# Built from a row by column name: TaskOut(**row)
+class TaskOut(msgspec.Struct):
+    id: int
+    title: str
+    description: str | None
+    status: str
+    created_at: str
+    updated_at: str
@@ -1,85 +1,135 @@
 import pytest
+from contextlib import ExitStack
+import time_machine
 from fastapi.testclient import TestClient
 from main import app
-from database import task_db
-from auth import fake_users_db, create_user, get_password_hash
+import auth
+from database import task_db, configure_connection, SCHEMA, READER_POOL_SIZE, TaskDatabase
+from auth import fake_users_db, create_user, get_password_hash, create_access_token, clear_user_caches, pwd_context
 from models import TaskStatus, TaskCreate
 from datetime import datetime, timedelta
 import sqlite3
+import threading
 import os
+import sys
 
 # ========================================
 # TEST SETUP & FIXTURES
 # ========================================
 
-@pytest.fixture(scope="function")
+# Password hashing is slow on purpose. Tests only need correct hashes, so use
+# the cheapest Argon2 settings (hashes made with them still verify the same way)
+pwd_context.update(argon2__memory_cost=1024, argon2__time_cost=1)
+
+# Hash the test password once, not per test
+_HASHED_SECRET = get_password_hash("secret")
+
+# Empty schema built once - each test clones it instead of re-running the DDL
+_TEMPLATE = sqlite3.connect(":memory:")
+for statement in SCHEMA:
+    _TEMPLATE.execute(statement)
+_TEMPLATE.commit()
+
+# Named in-memory database that every connection in this process can open -
+# the test fixture and the app's own connections all see the same data
+TEST_DB_URI = "file:testdb?mode=memory&cache=shared"
+
+@pytest.fixture(scope="function", autouse=True)
 def test_db():
     """Create a fresh in-memory database for each test"""
-    # Create new in-memory database
-    test_db = sqlite3.connect(":memory:")
-    cursor = test_db.cursor()
-    
-    # Create tasks table
-    cursor.execute("""
-        CREATE TABLE tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            status TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-    """)
-    test_db.commit()
+    # Reset the shared in-memory database to the template schema
+    test_db = sqlite3.connect(TEST_DB_URI, uri=True, check_same_thread=False, isolation_level=None)
+    _TEMPLATE.backup(test_db)
+    
+    # Same setup the app applies to its own connection, then relax
+    # journaling since this database is thrown away anyway
+    configure_connection(test_db)
+    test_db.executescript("PRAGMA journal_mode=MEMORY; PRAGMA synchronous=OFF;")
     
     # Override main database with test version
-    original_db = task_db.db_path
-    task_db.db_path = ":memory:"
+    original_db, original_conn = task_db.db_path, task_db.conn
+    task_db.db_path = TEST_DB_URI
     task_db.conn = test_db
     
     yield test_db  # Provide to test
     
-    # Cleanup
-    task_db.db_path = original_db
+    # Cleanup - the shared database lives on while the app still has it open,
+    # but the next test's backup() overwrites it anyway
+    task_db.db_path, task_db.conn = original_db, original_conn
     test_db.close()
 
-@pytest.fixture(scope="function")
-def test_client(test_db):
-    """Test client with clean auth state"""
-    # Reset fake users database
+def _seat_test_user():
+    """Reset the users 'database' to just the test user"""
     fake_users_db.clear()
-    
-    # Create test user
     fake_users_db["testuser"] = {
         "username": "testuser",
-        "hashed_password": get_password_hash("secret")
+        "hashed_password": _HASHED_SECRET
     }
+    clear_user_caches()
+
+@pytest.fixture(scope="session")
+def _client():
+    """One TestClient (and app event loop) shared by the whole test session"""
+    # Start the app against the test database so startup never touches tasks.db
+    original_db = task_db.db_path
+    task_db.db_path = TEST_DB_URI
+    with TestClient(app) as client:
+        yield client
+    task_db.db_path = original_db
+
+@pytest.fixture(scope="function")
+def test_client(_client, test_db):
+    """Shared test client with clean auth state"""
+    # Reset fake users database to just the test user
+    _seat_test_user()
     
-    return TestClient(app)
+    return _client
 
-@pytest.fixture
-def auth_token(test_client):
-    """Get auth token for test user"""
-    response = test_client.post("/auth/login", json={
+@pytest.fixture(scope="session")
+def _session_token(_client):
+    """Log the test user in once - the token stays valid for the whole session"""
+    _seat_test_user()
+    response = _client.post("/auth/login", json={
         "username": "testuser",
         "password": "secret"
     })
     return response.json()["access_token"]
 
+@pytest.fixture
+def auth_token(test_client, _session_token):
+    """Get auth token for test user"""
+    return _session_token
+
 # ========================================
 # HELPER FUNCTIONS
 # ========================================
 
+# Enum member -> plain string, looked up once instead of via .value each call
+_STATUS_STR = {s: s.value for s in TaskStatus}
+
 def create_test_task(test_client, token, title="Test Task", status=TaskStatus.PENDING):
     """Helper to create a task"""
     return test_client.post("/tasks", 
-        json={"title": title, "status": status.value},
+        json={"title": title, "status": _STATUS_STR[status]},
         headers={"Authorization": f"Bearer {token}"}
     )
 
-def iso_to_datetime(iso_str):
-    """Convert ISO string to datetime object"""
-    return datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
+def bulk_create_tasks(conn, rows):
+    """Insert (title, description, status, created_at, updated_at) rows in one transaction"""
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO tasks (title, description, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.execute("COMMIT")
+
+if sys.version_info >= (3, 11):
+    # fromisoformat understands a trailing "Z" from 3.11 on - no wrapper needed
+    iso_to_datetime = datetime.fromisoformat
+else:
+    def iso_to_datetime(iso_str):
+        """Convert ISO string to datetime object"""
+        return datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
 
 # ========================================
 # AUTHENTICATION TESTS
@@ -106,11 +156,88 @@ def test_login_invalid_credentials(test_client):
     assert response.status_code == 401
     assert response.json()["detail"] == "Incorrect username or password"
 
+def test_login_wrong_password_after_success(test_client, auth_token):
+    response = test_client.post("/auth/login", json={
+        "username": "testuser",
+        "password": "not-secret"
+    })
+    assert response.status_code == 401
+
+def test_bcrypt_hash_upgraded_on_login(test_client):
+    # Legacy bcrypt hash of "secret"
+    fake_users_db["legacyuser"] = {
+        "username": "legacyuser",
+        "hashed_password": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"
+    }
+    response = test_client.post("/auth/login", json={"username": "legacyuser", "password": "secret"})
+    assert response.status_code == 200
+    assert fake_users_db["legacyuser"]["hashed_password"].startswith("$argon2id$")
+
+def test_missing_user_checked_like_legacy_users(test_client):
+    # Only Argon2 hashes stored -> misses cost one Argon2 check
+    assert pwd_context.identify(auth._dummy_hash()) == "argon2"
+    
+    # A not-yet-upgraded bcrypt user exists -> misses cost a bcrypt check too
+    fake_users_db["legacyuser"] = {
+        "username": "legacyuser",
+        "hashed_password": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"
+    }
+    assert auth._dummy_hash().startswith("$2b$12$")
+
+def test_register_then_login(test_client):
+    # A failed lookup must not be remembered once the user registers
+    test_client.post("/auth/login", json={"username": "lateuser", "password": "pw"})
+    test_client.post("/auth/register", json={"username": "lateuser", "password": "pw"})
+    response = test_client.post("/auth/login", json={"username": "lateuser", "password": "pw"})
+    assert response.status_code == 200
+
+def test_concurrent_register_same_username(test_client, monkeypatch):
+    # Make both registrations finish hashing before either one stores its user
+    both_hashed = threading.Barrier(2)
+    def slow_hash(password):
+        hashed = get_password_hash(password)
+        both_hashed.wait(timeout=5)
+        return hashed
+    monkeypatch.setattr(auth, "get_password_hash", slow_hash)
+    
+    results = {}
+    def register(password):
+        try:
+            results[password] = create_user("alice", password)
+        except Exception as e:
+            results[password] = e
+    
+    threads = [threading.Thread(target=register, args=(pw,)) for pw in ("pw1", "pw2")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    # Exactly one wins, and the stored hash belongs to the winner
+    winners = [pw for pw, result in results.items() if isinstance(result, dict)]
+    assert len(winners) == 1
+    loser = ({"pw1", "pw2"} - set(winners)).pop()
+    assert results[loser].status_code == 400
+    assert pwd_context.verify(winners[0], fake_users_db["alice"]["hashed_password"])
+
 def test_protected_endpoint_no_token(test_client):
     response = test_client.get("/tasks")
     assert response.status_code == 401
     assert "WWW-Authenticate" in response.headers
 
+def test_token_reused_across_requests(test_client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    first = test_client.get("/auth/me", headers=headers)
+    second = test_client.get("/auth/me", headers=headers)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json()["username"] == "testuser"
+
+def test_expired_token_rejected(test_client):
+    expired_token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=-1))
+    response = test_client.get("/auth/me", headers={"Authorization": f"Bearer {expired_token}"})
+    assert response.status_code == 401
+
 # ========================================
 # TASK CRUD TESTS
 # ========================================
@@ -123,10 +250,13 @@ def test_create_task(test_client, auth_token):
     assert task["title"] == "Test Task"
     assert task["status"] == "Pending"
 
-def test_get_all_tasks(test_client, auth_token):
+def test_get_all_tasks(test_client, auth_token, test_db):
     # Create 2 tasks
-    create_test_task(test_client, auth_token, "Task 1")
-    create_test_task(test_client, auth_token, "Task 2", TaskStatus.COMPLETED)
+    now = datetime.now().isoformat()
+    bulk_create_tasks(test_db, [
+        ("Task 1", None, TaskStatus.PENDING.value, now, now),
+        ("Task 2", None, TaskStatus.COMPLETED.value, now, now),
+    ])
     
     response = test_client.get("/tasks", headers={"Authorization": f"Bearer {auth_token}"})
     assert response.status_code == 200
@@ -180,10 +310,13 @@ def test_delete_task(test_client, auth_token):
 # FILTERING & STATS TESTS
 # ========================================
 
-def test_filter_tasks_by_status(test_client, auth_token):
+def test_filter_tasks_by_status(test_client, auth_token, test_db):
     # Create tasks with different statuses
-    create_test_task(test_client, auth_token, "Pending Task", TaskStatus.PENDING)
-    create_test_task(test_client, auth_token, "Completed Task", TaskStatus.COMPLETED)
+    now = datetime.now().isoformat()
+    bulk_create_tasks(test_db, [
+        ("Pending Task", None, TaskStatus.PENDING.value, now, now),
+        ("Completed Task", None, TaskStatus.COMPLETED.value, now, now),
+    ])
     
     # Test pending filter
     pending_response = test_client.get(
@@ -203,20 +336,118 @@ def test_filter_tasks_by_status(test_client, auth_token):
     assert len(completed_tasks) == 1
     assert completed_tasks[0]["status"] == "Completed"
 
-def test_weekly_stats_calculation(test_client, auth_token, monkeypatch):
-    # Mock datetime for consistent week calculations
-    fixed_date = datetime(2025, 5, 28)  # Week 22 of 2025
-    class MockDatetime:
-        @classmethod
-        def now(cls):
-            return fixed_date
-    monkeypatch.setattr("main.datetime", MockDatetime)
-    monkeypatch.setattr("database.datetime", MockDatetime)
+def test_database_usable_without_open(tmp_path):
+    # Scripts may skip open() - the first read/write still creates the schema
+    db = TaskDatabase(str(tmp_path / "tasks.db"))
+    try:
+        assert db.get_task_count() == 0
+        created = db.create_task(TaskCreate(title="Script task"))
+        assert db.get_task_by_id(created.id).title == "Script task"
+    finally:
+        db.close()
+
+class _FailingCommit:
+    """Wraps a connection so COMMIT fails, like SQLITE_BUSY from another process would"""
+    def __init__(self, conn):
+        self._conn = conn
+    
+    def execute(self, sql, *args):
+        if sql == "COMMIT":
+            raise sqlite3.OperationalError("database is locked")
+        return self._conn.execute(sql, *args)
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def test_failed_commit_rolls_back(test_db, monkeypatch):
+    monkeypatch.setattr(task_db, "conn", _FailingCommit(test_db))
+    with pytest.raises(sqlite3.OperationalError):
+        task_db.create_task(TaskCreate(title="Lost task"))
+    monkeypatch.setattr(task_db, "conn", test_db)
+    
+    # The writer isn't stuck in the failed transaction - later writes work
+    assert not test_db.in_transaction
+    task_db.create_task(TaskCreate(title="Saved task"))
+    assert [task.title for task in task_db.get_all_tasks()] == ["Saved task"]
+
+def test_iter_task_batches_pages_through_all_rows(test_db):
+    # Identical created_at values, so paging has to fall back on the id
+    created = datetime(2025, 5, 28).isoformat()
+    bulk_create_tasks(test_db, [
+        (f"Task {i}", None, TaskStatus.PENDING.value if i % 2 else TaskStatus.COMPLETED.value, created, created)
+        for i in range(1, 8)
+    ])
+    
+    all_ids = [task.id for batch in task_db.iter_task_batches(batch_size=2) for task in batch]
+    assert all_ids == [1, 2, 3, 4, 5, 6, 7]
+    
+    pending = list(task_db.iter_task_batches(TaskStatus.PENDING, batch_size=2))
+    assert [[task.id for task in batch] for batch in pending] == [[1, 3], [5, 7]]
+    assert [task.id for task in task_db.get_all_tasks(TaskStatus.PENDING)] == [1, 3, 5, 7]
+
+def test_reads_survive_new_column(test_client, auth_token, test_db):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    task_id = create_test_task(test_client, auth_token, "Task 1").json()["id"]
+    test_db.execute("ALTER TABLE tasks ADD COLUMN completed_at TEXT")
+    
+    assert test_client.get(f"/tasks/{task_id}", headers=headers).json()["title"] == "Task 1"
+    assert len(test_client.get("/tasks", headers=headers).json()) == 1
+    assert test_client.put(f"/tasks/{task_id}", json={"title": "Renamed"}, headers=headers).status_code == 200
+
+def test_get_all_tasks_not_modified(test_client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    create_test_task(test_client, auth_token, "Task 1")
+    
+    first = test_client.get("/tasks", headers=headers)
+    etag = first.headers["ETag"]
+    
+    # Same version -> 304 with no body
+    cached = test_client.get("/tasks", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    
+    # Any write changes the ETag
+    create_test_task(test_client, auth_token, "Task 2")
+    changed = test_client.get("/tasks", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+
+def test_get_all_tasks_not_modified_header_forms(test_client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    etag = test_client.get("/tasks", headers=headers).headers["ETag"]
+    
+    # Weak validators, lists of ETags and "*" all count as a match
+    for if_none_match in (f"W/{etag}", f'"other", {etag}', "*"):
+        cached = test_client.get("/tasks", headers={**headers, "If-None-Match": if_none_match})
+        assert cached.status_code == 304
+    
+    stale = test_client.get("/tasks", headers={**headers, "If-None-Match": '"other"'})
+    assert stale.status_code == 200
+
+def test_etag_changes_when_clock_goes_backwards(test_client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    with time_machine.travel(datetime(2025, 5, 28, 12, 0), tick=False):
+        task_id = create_test_task(test_client, auth_token, "Task 1").json()["id"]
+        etag = test_client.get("/tasks", headers=headers).headers["ETag"]
+    
+    # An update stamped earlier than the last one (DST fall-back, NTP step)
+    with time_machine.travel(datetime(2025, 5, 28, 11, 0), tick=False):
+        test_client.put(f"/tasks/{task_id}", json={"title": "Renamed"}, headers=headers)
+        changed = test_client.get("/tasks", headers={**headers, "If-None-Match": etag})
+    
+    assert changed.status_code == 200
+    assert changed.json()[0]["title"] == "Renamed"
+
+def test_weekly_stats_calculation(test_client, auth_token, test_db):
+    # Fixed creation date for consistent week calculations
+    fixed_date = datetime(2025, 5, 28).isoformat()  # Week 22 of 2025
     
     # Create tasks in different statuses
-    create_test_task(test_client, auth_token, "Task 1", TaskStatus.PENDING)
-    create_test_task(test_client, auth_token, "Task 2", TaskStatus.COMPLETED)
-    create_test_task(test_client, auth_token, "Task 3", TaskStatus.COMPLETED)
+    bulk_create_tasks(test_db, [
+        ("Task 1", None, TaskStatus.PENDING.value, fixed_date, fixed_date),
+        ("Task 2", None, TaskStatus.COMPLETED.value, fixed_date, fixed_date),
+        ("Task 3", None, TaskStatus.COMPLETED.value, fixed_date, fixed_date),
+    ])
     
     response = test_client.get(
         "/tasks/weekly-stats",
@@ -232,10 +463,48 @@ def test_weekly_stats_calculation(test_client, auth_token, monkeypatch):
     assert week_data["completed_tasks"] == 2
     assert week_data["completion_percentage"] == 66.67
 
+def test_weekly_stats_uses_creation_time(test_client, auth_token):
+    # Freeze the clock (at the C level, for every module) while creating tasks
+    with time_machine.travel(datetime(2025, 5, 28, 12, 0), tick=False):  # Week 22 of 2025
+        create_test_task(test_client, auth_token, "Task 1", TaskStatus.PENDING)
+        create_test_task(test_client, auth_token, "Task 2", TaskStatus.COMPLETED)
+    
+    response = test_client.get(
+        "/tasks/weekly-stats",
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 200
+    week_data = response.json()["weekly_stats"][0]
+    assert week_data["week"] == "2025-W22"
+    assert week_data["week_start"] == "2025-05-26"
+    assert week_data["week_end"] == "2025-06-01"
+    assert week_data["completion_percentage"] == 50.0
+
 # ========================================
 # ERROR HANDLING TESTS
 # ========================================
 
+def test_reader_pool_exhausted_returns_503(test_client, auth_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    task_id = create_test_task(test_client, auth_token).json()["id"]
+    monkeypatch.setattr(task_db, "read_timeout", 0.1)
+    
+    with ExitStack() as stack:
+        # Hold every reader connection, like slow clients would
+        for _ in range(READER_POOL_SIZE):
+            stack.enter_context(task_db._read())
+        
+        busy = test_client.get(f"/tasks/{task_id}", headers=headers)
+        assert busy.status_code == 503
+        assert busy.headers["Retry-After"] == "1"
+        assert test_client.get("/tasks", headers=headers).status_code == 503
+        
+        # The rest of the app keeps answering
+        assert test_client.get("/health").status_code == 200
+    
+    # Readers are back in the pool
+    assert test_client.get(f"/tasks/{task_id}", headers=headers).status_code == 200
+
 def test_get_nonexistent_task(test_client, auth_token):
     response = test_client.get("/tasks/999", headers={"Authorization": f"Bearer {auth_token}"})
     assert response.status_code == 404
@@ -267,6 +536,17 @@ def test_create_task_invalid_data(test_client, auth_token):
     errors = response.json()["detail"]
     assert any("title" in error["loc"] for error in errors)
 
+def test_update_task_invalid_data(test_client, auth_token):
+    # Titles still have to be 1-200 characters when updating
+    response = test_client.put(
+        "/tasks/1",
+        json={"title": ""},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 422
+    errors = response.json()["detail"]
+    assert any("title" in error["loc"] for error in errors)
+
 # ========================================
 # PUBLIC ENDPOINT TESTS
 # ========================================